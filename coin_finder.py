@@ -3,6 +3,8 @@ import os
 from dotenv import load_dotenv
 
 from exchange_tools import OrderBook, ExchangeConnector
+from market_ranking import MarketRanking
+from order_store import prepare_storage, store_ranked_orders
 from sqlalchemy import URL, create_engine
 
 import threading
@@ -10,19 +12,18 @@ import threading
 
 class Obfetcher(threading.Thread):
 
-    def __init__(self, thr_name, db, symbol, api):
+    def __init__(self, thr_name, books, symbol, api):
         threading.Thread.__init__(self)
         self.name = thr_name
-        self.db = db
+        self.books = books
         self.symbol = symbol
         self.api = api
 
     def run(self):
         print(f"{self.name} started on {self.symbol}")
         current_book = OrderBook(self.symbol, self.api)
-        symbol_data = current_book.rank_peaks_base_volume('asks')
-        symbol_data.to_sql('orders', self.db, schema='ranked_orders', index=False, if_exists='append')
-        symbol_data.to_csv('sample.csv', index=False)
+        current_book.fetch_data()
+        self.books.append(current_book)
         print(f"{self.name} processed {self.symbol}")
 
 
@@ -38,12 +39,14 @@ if __name__ == '__main__':
         database='orderbook_sampler'
     )
     engine = create_engine(connection_string)
+    prepare_storage(engine)
 
     exchange = ExchangeConnector('kucoin', os.getenv('BASE_CURRENCY'))
     api = exchange.connect()
     available_coins = exchange.fetch_coins()
     print(f"Processing {len(available_coins)} coins")
 
+    books = list()
     idx = 0
     while idx < len(available_coins):
         threads = list()
@@ -51,11 +54,14 @@ if __name__ == '__main__':
             if idx == len(available_coins):
                 break
             coin = available_coins[idx]
-            threads.append(Obfetcher(f"fetcher-{idx}", engine, coin, api))
+            threads.append(Obfetcher(f"fetcher-{idx}", books, coin, api))
             idx += 1
         for thread in threads:
             thread.start()
         for thread in threads:
             thread.join()
 
-    print("Done")
+    ranked_orders = MarketRanking(books, 'asks').top_walls()
+    store_ranked_orders(engine, ranked_orders)
+    ranked_orders.to_csv('sample.csv', index=False)
+    print(f"Done, ranked {len(books)} books")
@@ -1,10 +1,12 @@
 import json
 import math
 import os
+import time
 from datetime import date, datetime
 from functools import reduce
 
 import ccxt
+import numpy as np
 import pandas as pd
 import pytz
 from ccxt import BadSymbol
@@ -14,82 +16,210 @@ from colorama import Fore, Style
 # TODO integrate multi-exchange support across all features of the module
 
 
+class BookSide:
+    """One side of an order book as contiguous price and quantity arrays,
+    best price first (ascending for asks, descending for bids)"""
+
+    __slots__ = ('prices', 'quantities', 'descending')
+
+    def __init__(self, prices, quantities, descending=False):
+        self.prices = prices
+        self.quantities = quantities
+        self.descending = descending
+
+    @classmethod
+    def from_levels(cls, levels, descending=False, dtype=np.float64):
+        """Builds the side from ccxt [price, quantity, ...] levels"""
+        if len(levels) == 0:
+            levels = np.empty((0, 2), dtype=dtype)
+        else:
+            levels = np.asarray(levels, dtype=dtype)[:, :2]
+        order = np.argsort(levels[:, OrderBook.PRICE], kind='stable')
+        if descending:
+            order = order[::-1]
+        return cls(np.ascontiguousarray(levels[order, OrderBook.PRICE]),
+                   np.ascontiguousarray(levels[order, OrderBook.QUANTITY]),
+                   descending)
+
+    def __len__(self):
+        return len(self.prices)
+
+    @property
+    def nbytes(self):
+        return self.prices.nbytes + self.quantities.nbytes
+
+    def within_price(self, price):
+        """View (no copy) on the levels from the best price up to the given price"""
+        if self.descending:
+            end = len(self.prices) - np.searchsorted(self.prices[::-1], price, side='left')
+        else:
+            end = np.searchsorted(self.prices, price, side='right')
+        return BookSide(self.prices[:end], self.quantities[:end], self.descending)
+
+
 class OrderBook:
     PRICE = 0
     QUANTITY = 1
 
-    def __init__(self, symbol, exchange):
+    __slots__ = ('symbol', 'api', 'dtype', 'bids', 'asks', 'timestamp', 'last_price')
+
+    def __init__(self, symbol, exchange, dtype=np.float64):
         self.symbol = symbol
         self.api = exchange
-        self.data = None
-        self.min_price = None
-        self.max_price = None
-        self.min_volume = None
-        self.max_volume = None
-        self.min_factor = None
-        self.max_factor = None
+        self.dtype = dtype
+        self.bids = None
+        self.asks = None
+        self.timestamp = None
         self.last_price = None
 
-    def sort_side_by(self, side='asks', field=PRICE):
-        result = list()
-        if side == 'asks':
-            result = sorted(self.data[side], key=lambda it: it[field])
-        else:
-            result = sorted(self.data[side], key=lambda it: it[field], reverse=True)
-        return result
+    @property
+    def min_price(self):
+        return self.asks.prices[0]
 
-    def fetch_data(self, force=False):
+    @property
+    def max_price(self):
+        return self.asks.prices[-1]
+
+    @property
+    def min_volume(self):
+        return self.asks.quantities[0]
+
+    @property
+    def max_volume(self):
+        return self.asks.quantities[-1]
+
+    @property
+    def min_factor(self):
+        return self.min_price / self.last_price
 
-        if self.data is None or force:
-            self.data = self.api.fetch_order_book(self.symbol)
-            sorted_asks = self.sort_side_by('asks', self.PRICE)
+    @property
+    def max_factor(self):
+        return self.max_price / self.last_price
 
-            self.min_price = sorted_asks[0][self.PRICE]
-            self.max_price = sorted_asks[-1][self.PRICE]
+    @property
+    def nbytes(self):
+        return self.bids.nbytes + self.asks.nbytes
 
-            self.min_volume = sorted_asks[0][self.QUANTITY]
-            self.max_volume = sorted_asks[-1][self.QUANTITY]
+    def side(self, side='asks'):
+        return self.asks if side == 'asks' else self.bids
 
-            self.fetch_price()
-            self.min_factor = self.min_price / self.last_price
-            self.max_factor = self.max_price / self.last_price
+    def sort_side_by(self, side='asks', field=PRICE):
+        book_side = self.side(side)
+        levels = np.column_stack((book_side.prices, book_side.quantities))
+        order = np.argsort(levels[:, field], kind='stable')
+        if side != 'asks':
+            order = order[::-1]
+        return levels[order].tolist()
+
+    def fetch_data(self, force=False):
+
+        if self.asks is None or force:
+            self.load_data(self.api.fetch_order_book(self.symbol))
+
+    def load_data(self, data, last_price=None):
+        """Uses an already fetched ccxt order book instead of querying the exchange.
+        Only the price and quantity arrays are kept, the raw levels are dropped."""
+        self.bids = BookSide.from_levels(data['bids'], descending=True, dtype=self.dtype)
+        self.asks = BookSide.from_levels(data['asks'], dtype=self.dtype)
+        self.timestamp = data.get('timestamp') or int(time.time() * 1000)
+        if last_price is not None:
+            self.last_price = last_price
+        self.fetch_price()
 
     def fetch_price(self, _force=False):
         if self.last_price is None or _force:
             self.last_price = self.api.fetch_ticker(symbol=self.symbol)['last']
 
+    def fetch_time(self):
+        return (datetime.fromtimestamp(self.timestamp / 1000, tz=pytz.timezone('Europe/Zurich'))
+                .strftime('%Y-%m-%dT%H:%M:%S%Z'))
+
+    @staticmethod
+    def parse_fetch_time(stamp):
+        """Zurich local datetime of a `fetch_time` string, CEST telling the DST side apart"""
+        local_time = datetime.strptime(stamp[:19], '%Y-%m-%dT%H:%M:%S')
+        return pytz.timezone('Europe/Zurich').localize(local_time, is_dst=stamp[19:] == 'CEST')
+
+    def up_to_factor(self, side, _factor):
+        """View on the levels of the side priced up to factor times the last price"""
+        self.fetch_data()
+        return self.side(side).within_price(self.last_price * _factor)
+
     def volume_at_factor(self, _factor):
         self.fetch_data()
         self.fetch_price()
         thr = self.last_price * _factor
-        filtered = list(filter(lambda it: it[self.PRICE] > thr, self.data))
-        return reduce(lambda a, v: a + v, map(lambda it: it[self.QUANTITY], filtered), 0)
+        return float(self.asks.quantities[self.asks.prices > thr].sum())
 
     def to_df(self, _side=None):
+        """Builds the DataFrame view of the book, only call it when one is needed"""
         self.fetch_data()
         self.fetch_price()
-        result = pd.DataFrame(
-            columns=['timestamp', 'symbol', 'side', 'price', 'factor', 'volume', 'base_volume', 'csum_base_volume'])
+        fetch_time = self.fetch_time()
+        frames = list()
 
         for side in ('bids', 'asks'):
             if _side is None or side == _side:
-                c_volume = 0
-                for item in self.sort_side_by(side, self.PRICE):
-                    _factor = item[self.PRICE] / self.last_price
-                    base_price = item[self.QUANTITY] * self.last_price
-                    c_volume += base_price
-                    result.loc[len(result)] = [
-                        datetime.now().astimezone(tz=pytz.timezone('Europe/Zurich')).strftime('%Y-%m-%dT%H:%M:%S%Z'),
-                        self.symbol,
-                        side,
-                        item[self.PRICE],
-                        _factor, item[self.QUANTITY],
-                        base_price,
-                        c_volume]
+                book_side = self.side(side)
+                base_volume = book_side.quantities * self.last_price
+                frames.append(pd.DataFrame({
+                    'timestamp': fetch_time,
+                    'symbol': self.symbol,
+                    'side': side,
+                    'price': book_side.prices,
+                    'factor': book_side.prices / self.last_price,
+                    'volume': book_side.quantities,
+                    'base_volume': base_volume,
+                    'csum_base_volume': np.cumsum(base_volume)}))
             else:
                 continue
 
-        return result
+        return pd.concat(frames, ignore_index=True)
+
+    def depth_by_factor(self, side='asks', bins=200, max_factor=None, scale='linear'):
+        """Buckets the depth of the side into `bins` factor bins, linearly or
+        logarithmically spaced, for plotting deep books at a fixed resolution.
+
+        `factor` and `price` are the bin edge farthest from the last price, so
+        `csum_base_volume` is the volume needed to move the price to that edge.
+        `max_base_volume` is the largest single order of the bin.
+
+        `max_factor` bounds the levels kept on the far side of the last price: for
+        asks it is an upper bound (e.g. 2 keeps asks up to twice the last price), for
+        bids a lower bound (e.g. 0.5 keeps bids down to half of it)."""
+        self.fetch_data()
+        book_side = self.up_to_factor(side, max_factor) if max_factor is not None else self.side(side)
+        factors = book_side.prices / self.last_price
+        if len(factors) == 0:
+            edges = np.empty(0)
+        elif scale == 'log':
+            edges = np.geomspace(factors.min(), factors.max(), bins + 1)
+        else:
+            edges = np.linspace(factors.min(), factors.max(), bins + 1)
+        if len(edges) < 2:
+            return pd.DataFrame(columns=['factor', 'price', 'levels', 'volume', 'base_volume',
+                                         'max_base_volume', 'csum_base_volume'])
+
+        levels, _ = np.histogram(factors, edges)
+        volume, _ = np.histogram(factors, edges, weights=book_side.quantities)
+        base_volume = volume * self.last_price
+        max_base_volume = np.zeros(bins)
+        bin_idx = np.clip(np.searchsorted(edges, factors, side='right') - 1, 0, bins - 1)
+        np.maximum.at(max_base_volume, bin_idx, book_side.quantities * self.last_price)
+
+        result = pd.DataFrame({
+            'factor': edges[1:],
+            'price': edges[1:] * self.last_price,
+            'levels': levels,
+            'volume': volume,
+            'base_volume': base_volume,
+            'max_base_volume': max_base_volume})
+        if side == 'bids':
+            result['factor'] = edges[:-1]
+            result['price'] = edges[:-1] * self.last_price
+            result = result.iloc[::-1].reset_index(drop=True)
+        result['csum_base_volume'] = result['base_volume'].cumsum()
+        return result[result['levels'] > 0].reset_index(drop=True)
 
     def rank_peaks_base_volume(self, side=None):
         _book_df = self.to_df(side)
@@ -99,20 +229,22 @@ class OrderBook:
         result['symbol'] = self.symbol
         return result
 
+    def filled_levels(self, side, _pump_volume):
+        """Number of levels, from the best price, whose cumulated base volume fits in the pump volume"""
+        book_side = self.side(side)
+        return int(np.searchsorted(np.cumsum(book_side.quantities * self.last_price), _pump_volume, side='right'))
+
     def pump_volume_factor(self, _pump_volume):
         self.fetch_data()
         self.fetch_price()
-        _full_asks = self.to_df('asks')
-        result = _full_asks.iloc[_full_asks[_full_asks['csum_base_volume'] <= _pump_volume].index.max()]['factor']
-
-        return result
+        filled = self.filled_levels('asks', _pump_volume)
+        return self.asks.prices[filled - 1] / self.last_price if filled > 0 else np.nan
 
     def pump_position_price(self, _pump_volume):
         self.fetch_data()
         self.fetch_price()
-        _full_bids = self.to_df('bids')
-        result = _full_bids.iloc[_full_bids[_full_bids['csum_base_volume'] <= _pump_volume].index.max()]['price']
-        return result
+        filled = self.filled_levels('bids', _pump_volume)
+        return self.bids.prices[filled - 1] if filled > 0 else np.nan
 
 
 class Position:
@@ -201,17 +333,23 @@ class Position:
 
 class ExchangeConnector:
 
-    supported_exchanges = ['kucoin', 'kucoin_f', 'binance_f', 'bitstamp']
-    separator = {'kucoin': '-', 'kucoin_f': '-', 'binance_f': '/', 'bitstamp': '/'}
+    supported_exchanges = ['kucoin', 'kucoin_f', 'binance_f', 'bitstamp', 'mock']
+    separator = {'kucoin': '-', 'kucoin_f': '-', 'binance_f': '/', 'bitstamp': '/', 'mock': '-'}
 
-    def __init__(self, name, base_currency):
+    def __init__(self, name, base_currency, credentials=None):
+        """`credentials` is called with the environment variable name (KUCOIN_API_KEY, ...)
+        of a credential that is not set in the environment, e.g. to read Streamlit secrets"""
         if name not in self.supported_exchanges:
             raise ValueError(f"Unsupported exchange {name}")
 
         self.name = name
         self.base_currency = base_currency
+        self.credentials = credentials
         self.exchange = None
 
+    def credential(self, key):
+        return os.getenv(key) or (self.credentials(key) if self.credentials else None)
+
     def make_symbol(self, term_coin):
         return f"{term_coin}{self.separator[self.name]}{self.base_currency}"
 
@@ -224,15 +362,17 @@ class ExchangeConnector:
             return self.provision_binance_futures_connection()
         elif self.name == 'bitstamp':
             return self.provision_bitstamp_spot_connection()
+        elif self.name == 'mock':
+            return self.provision_mock_connection()
         else:
             raise ValueError(f"Unsupported exchange {self.name}. Must be one of {self.supported_exchanges}")
 
     def provision_kucoin_spot_connection(self, verbose=False):
         self.exchange = ccxt.kucoin({
             'adjustForTimeDifference': True,
-            "apiKey": os.getenv("KUCOIN_API_KEY"),
-            "secret": os.getenv("KUCOIN_API_SECRET"),
-            'password': os.getenv("PASSWORD"),
+            "apiKey": self.credential("KUCOIN_API_KEY"),
+            "secret": self.credential("KUCOIN_API_SECRET"),
+            'password': self.credential("PASSWORD"),
         })
         self.exchange.verbose = verbose
         return self.exchange
@@ -240,17 +380,17 @@ class ExchangeConnector:
     def provision_kucoin_futures_connection(self, verbose=False):
         self.exchange = ccxt.kucoinfutures({
             'adjustForTimeDifference': True,
-            "apiKey": os.getenv("KUCOIN_API_KEY"),
-            "secret": os.getenv("KUCOIN_API_SECRET"),
-            'password': os.getenv("PASSWORD"),
+            "apiKey": self.credential("KUCOIN_API_KEY"),
+            "secret": self.credential("KUCOIN_API_SECRET"),
+            'password': self.credential("PASSWORD"),
         })
         self.exchange.verbose = verbose
         return self.exchange
 
     def provision_binance_futures_connection(self, verbose=False):
         self.exchange = ccxt.binance({
-            'apiKey': os.getenv('BINANCE_API_KEY'),
-            'secret': os.getenv('BINANCE_API_SECRET'),
+            'apiKey': self.credential('BINANCE_API_KEY'),
+            'secret': self.credential('BINANCE_API_SECRET'),
             'enableRateLimit': True,
             'options': {
                 'defaultType': 'future',
@@ -262,13 +402,19 @@ class ExchangeConnector:
 
     def provision_bitstamp_spot_connection(self, verbose=False):
         self.exchange = ccxt.bitstamp({
-            'apiKey': os.getenv('BITSTAMP_API_KEY'),
-            'secret': os.getenv('BITSTAMP_API_SECRET'),
+            'apiKey': self.credential('BITSTAMP_API_KEY'),
+            'secret': self.credential('BITSTAMP_API_SECRET'),
         })
         self.exchange.verbose = verbose
         self.exchange.load_markets()
         return self.exchange
 
+    def provision_mock_connection(self, verbose=False):
+        from mock_exchange import MockExchange
+        self.exchange = MockExchange(self.base_currency)
+        self.exchange.verbose = verbose
+        return self.exchange
+
     def fetch_coins(self):
         coins = self.exchange.public_get_symbols()
         coins = list(map(lambda it: it['symbol'],
@@ -0,0 +1,170 @@
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from ccxt import BaseError, RateLimitExceeded
+
+from coin_finder import Obfetcher
+from exchange_tools import Position
+from market_data import MarketDataService
+from market_ranking import MarketRanking
+from mock_exchange import MockExchange
+from order_book_diff import DepthTracker
+from order_book_sampler import SnapshotScheduler
+
+
+class MockConnector:
+    """ExchangeConnector stand-in handing out an already configured MockExchange"""
+
+    def __init__(self, api):
+        self.name = 'mock'
+        self.base_currency = api.base_currency
+        self.exchange = api
+
+    def connect(self):
+        return self.exchange
+
+
+class LoadTest:
+    """Runs the unit of work of each entry point against a MockExchange at
+    increasing concurrency and reports end-to-end throughput and latency.
+
+    Each level starts with a full rate limit bucket. Throughput and latency only
+    cover the tasks that succeeded, the ones rejected with a 429 are counted apart."""
+
+    def __init__(self, api, tasks=200, concurrency=(1, 2, 4, 8, 16, 32)):
+        self.api = api
+        self.tasks = tasks
+        self.concurrency = concurrency
+        self.symbols = [api.make_symbol(it) for it in api.coins]
+        self.books = list()
+        self.leaked = 0
+        self.leaked_lock = threading.Lock()
+        self.depth_tracker = DepthTracker()
+        self.sampler = SnapshotScheduler(MockConnector(api), self.symbols, rate=api.rate_limit, jitter=0)
+        for symbol in self.symbols:
+            os.makedirs(self.sampler.symbol_dir(symbol), exist_ok=True)
+        self.market_data = MarketDataService('mock', api.base_currency)
+        self.market_data.api = api
+        self.market_data.connector.exchange = api
+        self.entry_points = {
+            'coin_finder': self.coin_finder,
+            'order_book_sampler': self.order_book_sampler,
+            'market_data': self.dashboard,
+            'pump_dump_client': self.pump_dump_client,
+        }
+
+    def coin_finder(self, idx):
+        """Fetch of one book by an Obfetcher, run in the pool thread instead of its own"""
+        Obfetcher(f"fetcher-{idx}", self.books, self.symbols[idx % len(self.symbols)], self.api).run()
+
+    def order_book_sampler(self, idx):
+        """One snapshot of the scheduler with its csv and the depth tracking"""
+        symbol = self.symbols[idx % len(self.symbols)]
+        order_book = self.sampler.sample(symbol, time.time(), idx)
+        if order_book is None:
+            return False
+        self.depth_tracker.update(order_book)
+
+    def dashboard(self, idx):
+        """Background refresh of a book watched by the dashboard"""
+        symbol = self.symbols[idx % len(self.symbols)]
+        self.market_data.refresh_tickers()
+        self.market_data.refresh_book(symbol)
+
+    def pump_dump_client(self, idx, ticks=5):
+        """Opening, following and closing a small position, as the pump_dump_client loop"""
+        position = Position(self.api, self.api.base_currency, auto_close=False)
+        try:
+            position.open(10, self.api.coins[idx % len(self.api.coins)])
+            for _ in range(ticks):
+                position.evaluate(self.api.fetch_ticker(symbol=position.symbol))
+            position.close()
+        finally:
+            self.settle(position)
+
+    def settle(self, position):
+        """Closes a position a failed task left open. One that cannot be closed, or
+        whose fill is unknown, is counted as leaked since it skews the mock balances."""
+        if not position.is_open:
+            return
+        if position.size > 0:
+            try:
+                position.close()
+                return
+            except BaseError:
+                pass
+        with self.leaked_lock:
+            self.leaked += 1
+
+    def timed(self, entry_point, idx):
+        start = time.perf_counter()
+        try:
+            error = 'failed' if entry_point(idx) is False else None
+        except RateLimitExceeded:
+            error = 'rate_limited'
+        except BaseError as exc:
+            error = type(exc).__name__
+        return time.perf_counter() - start, error
+
+    def run_level(self, name, workers):
+        entry_point = self.entry_points[name]
+        self.books = list()
+        self.api.reset_rate_limit()
+        rejected = self.api.rate_limited
+        leaked = self.leaked
+        start = time.perf_counter()
+        # the entry points print every order and failed sample, keep them out of the report
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda idx: self.timed(entry_point, idx), range(self.tasks)))
+        elapsed = time.perf_counter() - start
+
+        latencies = np.array([it[0] for it in results if it[1] is None])
+        rate_limited = sum(1 for it in results if it[1] == 'rate_limited')
+        row = {'entry_point': name, 'concurrency': workers, 'tasks': self.tasks,
+               'succeeded': len(latencies), 'rate_limited': rate_limited,
+               'errors': len(results) - len(latencies) - rate_limited,
+               'rejected_requests': self.api.rate_limited - rejected,
+               'leaked_positions': self.leaked - leaked,
+               'throughput': len(latencies) / elapsed,
+               'p50_ms': np.nan, 'p95_ms': np.nan, 'p99_ms': np.nan}
+        if len(latencies) > 0:
+            row.update({'p50_ms': np.percentile(latencies, 50) * 1000,
+                        'p95_ms': np.percentile(latencies, 95) * 1000,
+                        'p99_ms': np.percentile(latencies, 99) * 1000})
+        if name == 'coin_finder':
+            start = time.perf_counter()
+            MarketRanking(self.books).top_walls()
+            row['ranking_ms'] = (time.perf_counter() - start) * 1000
+        return row
+
+    def run(self, entry_points=None):
+        rows = list()
+        for name in entry_points or self.entry_points:
+            for workers in self.concurrency:
+                row = self.run_level(name, workers)
+                print(f"{name:<20} x{workers:<3} {row['throughput']:8.1f}/s "
+                      f"p50 {row['p50_ms']:8.1f}ms p95 {row['p95_ms']:8.1f}ms p99 {row['p99_ms']:8.1f}ms "
+                      f"rate limited {row['rate_limited']} errors {row['errors']} "
+                      f"(429 responses {row['rejected_requests']}, leaked positions {row['leaked_positions']})")
+                rows.append(row)
+        return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    tasks = int(input("Tasks per concurrency level [200]: ") or 200)
+    rate_limit = float(input("Mock rate limit (requests/s) [30]: ") or 30)
+    latency = float(input("Mock median latency (ms) [80]: ") or 80) / 1000
+    mock_api = MockExchange(rate_limit=rate_limit, burst=2 * rate_limit, latency_median=latency, seed=42)
+    mock_api.schedule_pump(mock_api.coins[0], delay=10, factor=4)
+
+    os.chdir(tempfile.mkdtemp(prefix='load_test_'))
+    results = LoadTest(mock_api, tasks=tasks).run()
+    results.to_csv('load_test_results.csv', index=False)
+    print(f"Results written to {os.path.join(os.getcwd(), 'load_test_results.csv')}")
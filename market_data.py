@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from exchange_tools import ExchangeConnector, OrderBook
+
+# credentials whose name in the Streamlit secrets differs from the environment variable
+SECRET_NAMES = {'KUCOIN_API_SECRET': 'API_SECRET'}
+
+
+def dashboard_setting(secrets, *keys):
+    """First of the keys set in the environment, else in the Streamlit secrets (if any)"""
+    for key in keys:
+        if os.getenv(key):
+            return os.getenv(key)
+    for key in keys:
+        try:
+            value = secrets.get(key)
+        except FileNotFoundError:
+            return None
+        if value:
+            return value
+    return None
+
+
+class MarketDataService(threading.Thread):
+    """Owns the exchange connection and keeps the symbols, tickers and order books
+    the dashboard asks for fresh in the background.
+
+    Tickers of every market come from a single `fetch_tickers` call. Order books
+    are only polled for the symbols a page keeps watching, at most `max_books` of
+    them per refresh, the most recently viewed first.
+
+    Use `MarketDataService.dashboard` (or `shared`) so that every page and every session
+    of the Streamlit process reads from the same instance instead of calling the exchange."""
+
+    _instances = dict()
+    _instances_lock = threading.Lock()
+
+    def __init__(self, name, base_currency, credentials=None, refresh_interval=10, symbols_interval=3600,
+                 watch_ttl=300, max_books=20):
+        threading.Thread.__init__(self, daemon=True)
+        self.name = f"market-data-{name}-{base_currency}"
+        self.connector = ExchangeConnector(name, base_currency, credentials)
+        self.api = self.connector.connect()
+        self.refresh_interval = refresh_interval
+        self.symbols_interval = symbols_interval
+        self.watch_ttl = watch_ttl
+        self.max_books = max_books
+
+        self._lock = threading.Lock()
+        self._halt = threading.Event()
+        self._coins = None
+        self._coins_time = 0
+        self._tickers = dict()
+        self._tickers_time = 0
+        self._tickers_watched = 0
+        self._books = dict()
+        self._watched_books = dict()
+
+    @classmethod
+    def shared(cls, name, base_currency, credentials=None):
+        """Returns the process wide service for the exchange, starting it on first use.
+        A service started without credentials reconnects with the first ones provided."""
+        with cls._instances_lock:
+            key = (name, base_currency)
+            if key not in cls._instances:
+                service = cls(name, base_currency, credentials)
+                service.start()
+                cls._instances[key] = service
+            service = cls._instances[key]
+            if credentials is not None and service.connector.credentials is None:
+                service.connector.credentials = credentials
+                service.api = service.connector.connect()
+            return service
+
+    @classmethod
+    def dashboard(cls, secrets, name='kucoin'):
+        """The shared service of the Streamlit pages. Settings and credentials come from the
+        environment first, then from the Streamlit `secrets`, so that every page resolves
+        the same base currency and therefore the same service."""
+        load_dotenv()
+        return cls.shared(name, dashboard_setting(secrets, 'BASE_CURRENCY', 'BASE_COIN'),
+                          credentials=lambda key: dashboard_setting(secrets, SECRET_NAMES.get(key, key)))
+
+    def coins(self):
+        if self._coins is None:
+            self.refresh_coins()
+        return list(self._coins)
+
+    def ticker(self, symbol):
+        """Latest ticker of the symbol. A missing ticker reloads the tickers of every
+        market at once, so asking for many symbols costs a single request."""
+        self._tickers_watched = time.time()
+        if symbol not in self._tickers and time.time() - self._tickers_time > self.refresh_interval:
+            self.refresh_tickers()
+        if symbol not in self._tickers:
+            ticker = self.api.fetch_ticker(symbol=symbol)
+            with self._lock:
+                self._tickers[symbol] = ticker
+        return self._tickers[symbol]
+
+    def order_book(self, symbol, watch=True):
+        """Latest snapshot of the order book. The returned OrderBook is never
+        refreshed in place, a new one replaces it on the next refresh.
+        With `watch=False` the book is fetched once and not polled afterwards."""
+        if not watch:
+            return self.fetch_book(symbol)
+        with self._lock:
+            self._watched_books[symbol] = time.time()
+        if symbol not in self._books:
+            self.refresh_book(symbol)
+        return self._books[symbol]
+
+    def watched_books(self):
+        """Symbols whose book is still watched, most recently viewed first, at most `max_books`"""
+        with self._lock:
+            expiry = time.time() - self.watch_ttl
+            for symbol in [it for it, seen in self._watched_books.items() if seen < expiry]:
+                del self._watched_books[symbol]
+                self._books.pop(symbol, None)
+            watched = sorted(self._watched_books, key=self._watched_books.get, reverse=True)
+        return watched[:self.max_books]
+
+    def refresh_coins(self):
+        coins = self.connector.fetch_coins()
+        with self._lock:
+            self._coins = coins
+            self._coins_time = time.time()
+
+    def refresh_tickers(self):
+        tickers = self.api.fetch_tickers()
+        with self._lock:
+            for symbol, ticker in tickers.items():
+                self._tickers[symbol] = ticker
+                # ccxt keys by unified symbol (BTC/USDT), the pages use the market id (BTC-USDT)
+                market_id = (ticker.get('info') or dict()).get('symbol')
+                if market_id:
+                    self._tickers[market_id] = ticker
+            self._tickers_time = time.time()
+
+    def fetch_book(self, symbol):
+        book = OrderBook(symbol, self.api)
+        last_price = self._tickers[symbol]['last'] if symbol in self._tickers else None
+        book.load_data(self.api.fetch_order_book(symbol), last_price)
+        return book
+
+    def refresh_book(self, symbol):
+        book = self.fetch_book(symbol)
+        with self._lock:
+            self._books[symbol] = book
+
+    def guarded(self, what, refresh, *args):
+        """Runs one refresh step, a failure only skips that step"""
+        try:
+            refresh(*args)
+        except Exception as error:
+            print(f"{self.name} refresh of {what} failed: {error!r}")
+
+    def refresh(self):
+        if time.time() - self._coins_time > self.symbols_interval:
+            self.guarded('symbols', self.refresh_coins)
+        symbols = self.watched_books()
+        if symbols or time.time() - self._tickers_watched < self.watch_ttl:
+            self.guarded('tickers', self.refresh_tickers)
+        for symbol in symbols:
+            self.guarded(symbol, self.refresh_book, symbol)
+
+    def run(self):
+        while not self._halt.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as error:
+                print(f"{self.name} refresh failed: {error!r}")
+
+    def stop(self):
+        self._halt.set()
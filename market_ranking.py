@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+
+class MarketRanking:
+    """One side of many order books stacked into a single segmented array.
+
+    Level i of the stack belongs to the book `segment[i]`, whose levels start at
+    `offsets[segment[i]]`. Per-symbol statistics are computed with reductions over
+    the segments, so ranking the whole exchange is a handful of array operations
+    rather than one DataFrame per symbol."""
+
+    def __init__(self, books, side='asks'):
+        books = [it for it in books if len(it.side(side)) > 0]
+        sides = [it.side(side) for it in books]
+        self.side = side
+        self.symbols = np.array([it.symbol for it in books], dtype=object)
+        self.fetch_times = np.array([it.fetch_time() for it in books], dtype=object)
+
+        self.lengths = np.array([len(it) for it in sides], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(self.lengths)[:-1])).astype(np.int64)
+        self.segment = np.repeat(np.arange(len(books)), self.lengths)
+
+        last_prices = np.array([it.last_price for it in books], dtype=np.float64)
+        if len(books) > 0:
+            self.prices = np.concatenate([it.prices for it in sides]).astype(np.float64, copy=False)
+            self.volumes = np.concatenate([it.quantities for it in sides]).astype(np.float64, copy=False)
+        else:
+            self.prices = np.empty(0)
+            self.volumes = np.empty(0)
+        self.factors = self.prices / last_prices[self.segment]
+        self.base_volumes = self.volumes * last_prices[self.segment]
+        self.csum_base_volumes = self.segment_cumsum(self.base_volumes)
+        self.volume_rankings = self.segment_zscore(self.base_volumes)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def segment_sum(self, values):
+        if len(values) == 0:
+            return np.empty(0)
+        return np.add.reduceat(values, self.offsets)
+
+    def segment_cumsum(self, values):
+        """Cumulative sum restarting at the first level of each book"""
+        total = np.cumsum(values)
+        before_segment = total[self.offsets] - values[self.offsets] if len(values) > 0 else total
+        return total - before_segment[self.segment]
+
+    def segment_zscore(self, values):
+        """Z-score of each level within its own book (sample std, as pandas)"""
+        mean = self.segment_sum(values) / self.lengths
+        deviation = values - mean[self.segment]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = np.sqrt(self.segment_sum(deviation ** 2) / (self.lengths - 1))
+            return deviation / std[self.segment]
+
+    def depth_up_to(self, _factor):
+        """Base volume of every book up to factor times its last price"""
+        return self.segment_sum(np.where(self.factors <= _factor, self.base_volumes, 0.0))
+
+    def pump_volume_factors(self, pump_volume):
+        """Factor reached in every book by `pump_volume`, as `OrderBook.pump_volume_factor`"""
+        filled = self.segment_sum((self.csum_base_volumes <= pump_volume).astype(np.int64))
+        last_filled = np.clip(self.offsets + filled - 1, 0, None)
+        return np.where(filled > 0, self.factors[last_filled], np.nan)
+
+    def peak_levels(self):
+        """Index of the highest ranked level of every book"""
+        return np.lexsort((-self.volume_rankings, self.segment))[self.offsets]
+
+    def top_walls(self, top=5, factor_range=None, volume_range=None):
+        """The `top` highest ranked levels of every book, optionally restricted to the
+        factor and cumulated base volume ranges used by the Coin forecast screen.
+        Returns the same columns as `OrderBook.rank_peaks_base_volume`."""
+        order = np.lexsort((-self.volume_rankings, self.segment))
+        rank = np.arange(len(order)) - self.offsets[self.segment[order]]
+        selected = order[rank < top]
+
+        mask = np.ones(len(selected), dtype=bool)
+        if factor_range is not None:
+            mask &= (self.factors[selected] >= factor_range[0]) & (self.factors[selected] <= factor_range[1])
+        if volume_range is not None:
+            mask &= ((self.csum_base_volumes[selected] >= volume_range[0])
+                     & (self.csum_base_volumes[selected] <= volume_range[1]))
+        selected = selected[mask]
+
+        return pd.DataFrame({
+            'timestamp': self.fetch_times[self.segment[selected]],
+            'symbol': self.symbols[self.segment[selected]],
+            'side': self.side,
+            'price': self.prices[selected],
+            'factor': self.factors[selected],
+            'volume': self.volumes[selected],
+            'base_volume': self.base_volumes[selected],
+            'csum_base_volume': self.csum_base_volumes[selected],
+            'volume_ranking': self.volume_rankings[selected]})
+
+    def screen(self, factor_range, volume_range, top=5):
+        """Markets of interest, aggregated per symbol like the Coin forecast page"""
+        walls = self.top_walls(top, factor_range, volume_range)
+        return walls.groupby('symbol', as_index=False).agg(**{
+            'Cumulated Base Volume': ('csum_base_volume', 'max'),
+            'Volume Ranking': ('volume_ranking', 'max'),
+            'Factor': ('factor', 'max'),
+            'Price': ('price', 'max')}).rename(columns={'symbol': 'Symbol'})
@@ -0,0 +1,232 @@
+import hashlib
+import itertools
+import math
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from ccxt import NetworkError, OrderNotFound, RateLimitExceeded, BadSymbol
+
+
+class ScriptedPump:
+    """Price multiplier of a pump: linear ramp up to `factor` then decay back to 1"""
+
+    def __init__(self, start, factor=3, ramp=30, decay=300):
+        self.start = start
+        self.factor = factor
+        self.ramp = ramp
+        self.decay = decay
+
+    def multiplier(self, now):
+        elapsed = now - self.start
+        if elapsed < 0 or elapsed > self.ramp + self.decay:
+            return 1
+        if elapsed < self.ramp:
+            return 1 + (self.factor - 1) * elapsed / self.ramp
+        return self.factor - (self.factor - 1) * (elapsed - self.ramp) / self.decay
+
+
+class MockExchange:
+    """Local stand-in for the ccxt KuCoin client, serving the calls made by
+    ExchangeConnector, OrderBook and Position from synthetic markets.
+
+    Every call waits for a log-normally distributed latency, counts against a
+    token bucket that raises RateLimitExceeded when empty and fails with a
+    NetworkError with probability `error_rate`. Prices follow a random walk per
+    symbol, order books are regenerated around the price every `book_refresh`
+    seconds with a few walls, and `schedule_pump` scripts a pump on a coin."""
+
+    def __init__(self, base_currency='USDT', coins=200, latency_median=0.08, latency_sigma=0.5,
+                 rate_limit=30, burst=60, error_rate=0.0, depth=300, volatility=0.002, book_refresh=1,
+                 balance=1000, fee_rate=0.001, seed=None):
+        self.id = 'mock'
+        self.verbose = False
+        self.base_currency = base_currency
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.error_rate = error_rate
+        self.depth = depth
+        self.volatility = volatility
+        self.book_refresh = book_refresh
+        self.fee_rate = fee_rate
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.tokens_time = time.monotonic()
+        self.calls = 0
+        self.rate_limited = 0
+
+        self.coins = [f"M{idx:03}" for idx in range(coins)]
+        self.prices = {self.make_symbol(it): 10 ** self.random.uniform(-5, 2) for it in self.coins}
+        self.price_times = {it: time.time() for it in self.prices}
+        self.pumps = dict()
+        self.balances = {base_currency: float(balance)}
+        self.orders = dict()
+        self.order_ids = itertools.count(1)
+
+    def make_symbol(self, coin):
+        return f"{coin}-{self.base_currency}"
+
+    def request(self):
+        """Latency, rate limit and failure simulation shared by all the endpoints"""
+        with self.lock:
+            self.calls += 1
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.tokens_time) * self.rate_limit)
+            self.tokens_time = now
+            if self.tokens < 1:
+                self.rate_limited += 1
+                raise RateLimitExceeded('mock 429 Too Many Requests')
+            self.tokens -= 1
+            latency = self.random.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+            failed = self.random.random() < self.error_rate
+        time.sleep(latency)
+        if failed:
+            raise NetworkError('mock connection reset')
+
+    def reset_rate_limit(self):
+        """Refills the token bucket, e.g. between the levels of a load test"""
+        with self.lock:
+            self.tokens = self.burst
+            self.tokens_time = time.monotonic()
+
+    def check_symbol(self, symbol):
+        if symbol not in self.prices:
+            raise BadSymbol(f'mock does not have market symbol {symbol}')
+
+    def schedule_pump(self, coin, delay=0, factor=3, ramp=30, decay=300):
+        symbol = self.make_symbol(coin)
+        self.check_symbol(symbol)
+        self.pumps[symbol] = ScriptedPump(time.time() + delay, factor, ramp, decay)
+
+    def price(self, symbol):
+        """Random walk price of the symbol at the current time, pump included"""
+        with self.lock:
+            now = time.time()
+            elapsed = now - self.price_times[symbol]
+            self.prices[symbol] *= math.exp(self.volatility * math.sqrt(elapsed) * self.random.gauss(0, 1))
+            self.price_times[symbol] = now
+            price = self.prices[symbol]
+        pump = self.pumps.get(symbol)
+        return price * pump.multiplier(now) if pump is not None else price
+
+    def book_random(self, symbol, now):
+        """Generator fixed for a book refresh period so that consecutive snapshots mostly agree"""
+        seed = hashlib.sha256(f"{symbol}-{int(now / self.book_refresh)}".encode()).digest()
+        return random.Random(int.from_bytes(seed[:8], 'big'))
+
+    def levels(self, rnd, price, direction):
+        levels = list()
+        for idx in range(self.depth):
+            level_price = price * (1 + direction * 0.001 * (idx + 1) * (1 + idx / 50))
+            if level_price <= 0:
+                break
+            quantity = rnd.lognormvariate(math.log(200 / price), 1)
+            if rnd.random() < 0.02:
+                quantity *= 25
+            levels.append([level_price, quantity])
+        return levels
+
+    @staticmethod
+    def timestamps(now):
+        return int(now * 1000), datetime.fromtimestamp(now, tz=timezone.utc).isoformat()
+
+    def public_get_symbols(self, params=None):
+        self.request()
+        return {'code': '200000', 'data': [{
+            'symbol': self.make_symbol(it),
+            'name': self.make_symbol(it),
+            'baseCurrency': it,
+            'quoteCurrency': self.base_currency,
+            'enableTrading': True} for it in self.coins]}
+
+    def load_markets(self, reload=False):
+        return {it: {'symbol': it, 'active': True} for it in self.prices}
+
+    def build_ticker(self, symbol):
+        price = self.price(symbol)
+        timestamp, iso_time = self.timestamps(time.time())
+        return {'symbol': symbol, 'timestamp': timestamp, 'datetime': iso_time, 'time': timestamp,
+                'bid': price * 0.999, 'ask': price * 1.001, 'last': price,
+                'info': {'symbol': symbol, 'time': timestamp}}
+
+    def fetch_ticker(self, symbol, params=None):
+        self.request()
+        self.check_symbol(symbol)
+        return self.build_ticker(symbol)
+
+    def fetch_tickers(self, symbols=None, params=None):
+        self.request()
+        return {it: self.build_ticker(it) for it in (symbols or self.prices) if it in self.prices}
+
+    def fetch_order_book(self, symbol, limit=None, params=None):
+        self.request()
+        self.check_symbol(symbol)
+        now = time.time()
+        price = self.price(symbol)
+        rnd = self.book_random(symbol, now)
+        timestamp, iso_time = self.timestamps(now)
+        return {'symbol': symbol,
+                'bids': self.levels(rnd, price * 0.999, -1)[:limit],
+                'asks': self.levels(rnd, price * 1.001, 1)[:limit],
+                'timestamp': timestamp, 'datetime': iso_time, 'nonce': None}
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params=None):
+        self.request()
+        self.check_symbol(symbol)
+        step = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}[timeframe] * 1000
+        limit = limit or 100
+        start = since if since is not None else int(time.time() * 1000) - limit * step
+        start -= start % step
+        price = self.prices[symbol]
+        candles = list()
+        for candle_time in range(start, start + limit * step, step):
+            rnd = self.book_random(f"{symbol}-{timeframe}", candle_time / 1000)
+            close = price * math.exp(self.volatility * 10 * rnd.gauss(0, 1))
+            high = max(price, close) * (1 + abs(rnd.gauss(0, self.volatility)))
+            low = min(price, close) * (1 - abs(rnd.gauss(0, self.volatility)))
+            candles.append([candle_time, price, high, low, close, rnd.lognormvariate(math.log(1e5 / close), 1)])
+            price = close
+        return candles
+
+    def fetch_accounts(self, params=None):
+        self.request()
+        currency = (params or dict()).get('currency', self.base_currency)
+        return [{'id': f'mock-{currency}', 'type': 'trade', 'currency': currency,
+                 'info': {'currency': currency, 'type': 'trade',
+                          'available': str(self.balances.get(currency, 0.0))}}]
+
+    def create_market_order(self, symbol, side, amount):
+        self.request()
+        self.check_symbol(symbol)
+        ticker = self.build_ticker(symbol)
+        price = ticker['ask'] if side == 'buy' else ticker['bid']
+        cost = amount * price
+        coin = symbol.split('-')[0]
+        with self.lock:
+            sign = 1 if side == 'buy' else -1
+            self.balances[self.base_currency] = self.balances.get(self.base_currency, 0.0) - sign * cost
+            self.balances[coin] = self.balances.get(coin, 0.0) + sign * amount
+            order_id = str(next(self.order_ids))
+            self.orders[order_id] = {
+                'id': order_id, 'symbol': symbol, 'type': 'market', 'side': side, 'status': 'closed',
+                'timestamp': ticker['timestamp'], 'datetime': ticker['datetime'],
+                'price': price, 'amount': amount, 'filled': amount, 'cost': cost,
+                'fees': [{'cost': cost * self.fee_rate, 'currency': self.base_currency}]}
+        return {'id': order_id, 'symbol': symbol, 'info': {'orderId': order_id}}
+
+    def create_market_buy_order(self, symbol, amount, params=None):
+        return self.create_market_order(symbol, 'buy', amount)
+
+    def create_market_sell_order(self, symbol, amount, params=None):
+        return self.create_market_order(symbol, 'sell', amount)
+
+    def fetch_order(self, id, symbol=None, params=None):
+        self.request()
+        if id not in self.orders:
+            raise OrderNotFound(f'mock order {id} not found')
+        return dict(self.orders[id])
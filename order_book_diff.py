@@ -0,0 +1,125 @@
+import threading
+
+import numpy as np
+
+
+def diff_sides(previous, current):
+    """Aligns two snapshots of the same book side by price level.
+
+    Returns the prices whose quantity changed with the previous and current
+    quantity at that price, a missing level counting as zero."""
+    prices = np.union1d(previous.prices, current.prices)
+    previous_quantities = np.zeros(len(prices))
+    current_quantities = np.zeros(len(prices))
+    previous_quantities[np.searchsorted(prices, previous.prices)] = previous.quantities
+    current_quantities[np.searchsorted(prices, current.prices)] = current.quantities
+    changed = previous_quantities != current_quantities
+    return prices[changed], previous_quantities[changed], current_quantities[changed]
+
+
+class BookDiff:
+    """Liquidity added, removed and changed between two snapshots,
+    in base volume per factor band of the reference price"""
+
+    __slots__ = ('symbol', 'bands', 'added', 'removed', 'changed', 'levels')
+
+    def __init__(self, symbol, bands, added, removed, changed, levels):
+        self.symbol = symbol
+        self.bands = bands
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.levels = levels
+
+    def __str__(self):
+        return " ".join(f"[{low:g}x-{high:g}x +{add:,.0f} -{abs(rem):,.0f} ~{chg:+,.0f}]"
+                        for low, high, add, rem, chg in zip(self.bands[:-1], self.bands[1:],
+                                                            self.added, self.removed, self.changed))
+
+
+class SymbolDepth:
+    """Rolling depth state of one symbol, updated from the changed levels only"""
+
+    __slots__ = ('side', 'reference_price', 'band_depth', 'baseline')
+
+    def __init__(self, side, reference_price, band_depth):
+        self.side = side
+        self.reference_price = reference_price
+        self.band_depth = band_depth
+        self.baseline = np.cumsum(band_depth)
+
+
+class DepthTracker:
+    """Keeps per-symbol depth by factor band up to date across consecutive snapshots
+    and raises an alert when the depth up to `alert_factor`, one of the band edges
+    above the first, collapses.
+
+    Bands are factors of a reference price fixed at the first snapshot, so a level
+    stays in its band between snapshots and only changed levels touch the
+    statistics. The reference is reset when the last price drifts by more than
+    `rebase` from it. The baseline is an exponential moving average of the
+    cumulated band depth; an alert fires when the depth up to the alert factor
+    falls below `1 - collapse` times its baseline."""
+
+    def __init__(self, bands=(1, 1.25, 1.5, 2, 3, 5, 10), side='asks', alert_factor=2, collapse=0.5,
+                 smoothing=0.1, rebase=0.1):
+        self.bands = np.asarray(bands, dtype=np.float64)
+        if alert_factor not in self.bands[1:]:
+            raise ValueError(f"Alert factor {alert_factor:g} must be one of the band edges "
+                             f"{', '.join(f'{it:g}' for it in self.bands[1:])}")
+        self.side = side
+        self.alert_band = int(np.searchsorted(self.bands, alert_factor, side='left')) - 1
+        self.collapse = collapse
+        self.smoothing = smoothing
+        self.rebase = rebase
+        self.lock = threading.Lock()
+        self.symbols = dict()
+
+    def band_of(self, prices, reference_price):
+        """Band index of every price, -1 outside of the bands"""
+        band = np.searchsorted(self.bands * reference_price, prices, side='right') - 1
+        band[band >= len(self.bands) - 1] = -1
+        return band
+
+    def band_sum(self, band, values):
+        inside = band >= 0
+        return np.bincount(band[inside], weights=values[inside], minlength=len(self.bands) - 1)
+
+    def reset(self, symbol, order_book):
+        book_side = order_book.side(self.side)
+        band = self.band_of(book_side.prices, order_book.last_price)
+        state = SymbolDepth(book_side, order_book.last_price,
+                            self.band_sum(band, book_side.quantities * order_book.last_price))
+        with self.lock:
+            self.symbols[symbol] = state
+        return state
+
+    def update(self, order_book):
+        """Folds a new snapshot into the symbol statistics.
+        Returns the diff against the previous snapshot (None for the first one)
+        and the alert messages it raised."""
+        symbol = order_book.symbol
+        state = self.symbols.get(symbol)
+        if state is None or abs(order_book.last_price / state.reference_price - 1) > self.rebase:
+            self.reset(symbol, order_book)
+            return None, list()
+
+        current = order_book.side(self.side)
+        prices, before, after = diff_sides(state.side, current)
+        band = self.band_of(prices, state.reference_price)
+        delta = (after - before) * state.reference_price
+        diff = BookDiff(symbol, self.bands,
+                        self.band_sum(band, np.where(before == 0, delta, 0.0)),
+                        self.band_sum(band, np.where(after == 0, delta, 0.0)),
+                        self.band_sum(band, np.where((before > 0) & (after > 0), delta, 0.0)),
+                        len(prices))
+        state.side = current
+        state.band_depth += diff.added + diff.removed + diff.changed
+
+        alerts = list()
+        depth = np.cumsum(state.band_depth)
+        if depth[self.alert_band] < (1 - self.collapse) * state.baseline[self.alert_band]:
+            alerts.append(f"{symbol}: depth up to {self.bands[self.alert_band + 1]:g}x fell to "
+                          f"{depth[self.alert_band]:,.0f} from {state.baseline[self.alert_band]:,.0f}")
+        state.baseline += self.smoothing * (depth - state.baseline)
+        return diff, alerts
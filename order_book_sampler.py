@@ -1,10 +1,147 @@
+import math
 import os
+import random
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
+from ccxt import BaseError
 from dotenv import load_dotenv
 
 from exchange_tools import OrderBook, ExchangeConnector
+from order_book_diff import DepthTracker
+
+
+class RateBudget:
+    """Spaces out the requests of all the fetch threads so that
+    at most `rate` of them start per second"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next_slot = 0
+
+    def acquire(self, requests=1, timeout=None):
+        """Waits for the turn of the requests. Returns False without taking a turn
+        when it would come more than `timeout` seconds from now"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            if timeout is not None and slot - now > timeout:
+                return False
+            self.next_slot = slot + requests * self.interval
+        time.sleep(slot - now)
+        return True
+
+
+class SnapshotScheduler:
+    """Samples the order books of a watchlist on fixed, wall-clock aligned ticks.
+
+    Tick k is at the k-th multiple of `period` seconds since the epoch, so samples
+    of every symbol (and of several samplers) share the same time grid. A symbol
+    whose previous fetch is still running when a tick fires misses that tick, and
+    ticks the scheduler itself was too late for are counted as missed for all.
+    A sample that only gets its turn (in the pool or the rate budget) after the
+    next tick is dropped as missed rather than written under a stale tick."""
+
+    def __init__(self, exchange, symbols, period=2, max_workers=4, rate=10, jitter=0.1, on_snapshot=None):
+        self.exchange = exchange
+        self.api = exchange.connect()
+        self.symbols = symbols
+        self.period = period
+        self.max_workers = max_workers
+        self.rate = rate
+        self.rate_budget = RateBudget(rate)
+        self.jitter = jitter
+        self.on_snapshot = on_snapshot
+        self.sequence = 0
+        self.sampled = {it: 0 for it in symbols}
+        self.missed = {it: 0 for it in symbols}
+        self.failed = {it: 0 for it in symbols}
+        self.in_flight = dict()
+
+    def symbol_dir(self, symbol):
+        return f"{symbol.replace('/', '_')}_{self.exchange.name}"
+
+    def next_tick(self, now):
+        return (math.floor(now / self.period) + 1) * self.period
+
+    def sample(self, symbol, tick, seq):
+        # spread the requests of one tick instead of bursting them all at once
+        time.sleep(random.uniform(0, self.jitter * self.period))
+        # order book and ticker, unless their turn comes after the next tick
+        if not self.rate_budget.acquire(2, timeout=tick + self.period - time.time()):
+            self.missed[symbol] += 1
+            print(f"Missed sample #{seq} of {symbol}: started after the next tick")
+            return None
+        try:
+            order_book = OrderBook(symbol, self.api)
+            order_book.fetch_data()
+        except BaseError as error:
+            self.failed[symbol] += 1
+            print(f"Failed sample #{seq} of {symbol}: {error}")
+            return None
+
+        order_book_df = order_book.to_df('asks')
+        order_book_df['sequence'] = seq
+        order_book_df['tick'] = datetime.fromtimestamp(tick, tz=timezone.utc).isoformat()
+        order_book_df.to_csv(
+            os.path.join(self.symbol_dir(symbol),
+                         f"ob_{seq:0>3}_{self.symbol_dir(symbol)}-{datetime.now().strftime('%Y-%m-%d')}.csv"),
+            index=False)
+        if self.on_snapshot is not None:
+            self.on_snapshot(symbol, tick, order_book)
+        self.sampled[symbol] += 1
+        return order_book
+
+    def sample_done(self, symbol, future):
+        """Reports the errors `sample` does not handle itself (csv, callback, malformed book)"""
+        if future.cancelled() or future.exception() is None:
+            return
+        self.failed[symbol] += 1
+        print(f"Failed sample of {symbol}: {future.exception()!r}")
+
+    def run(self):
+        for symbol in self.symbols:
+            os.makedirs(self.symbol_dir(symbol), exist_ok=True)
+        if 2 * len(self.symbols) / self.period > self.rate:
+            print(f"Warning: {len(self.symbols)} symbols every {self.period:g}s need "
+                  f"{2 * len(self.symbols) / self.period:g} requests/s, more than the rate of {self.rate:g}/s. "
+                  f"Expect missed ticks")
+
+        tick = self.next_tick(time.time())
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while True:
+                time.sleep(max(0.0, tick - time.time()))
+                late_ticks = int((time.time() - tick) // self.period)
+                if late_ticks > 0:
+                    for symbol in self.symbols:
+                        self.missed[symbol] += late_ticks
+                    tick += late_ticks * self.period
+                    self.sequence += late_ticks
+
+                for symbol in self.symbols:
+                    if symbol in self.in_flight and not self.in_flight[symbol].done():
+                        self.missed[symbol] += 1
+                    else:
+                        self.in_flight[symbol] = pool.submit(self.sample, symbol, tick, self.sequence)
+                        self.in_flight[symbol].add_done_callback(
+                            lambda future, _symbol=symbol: self.sample_done(_symbol, future))
+                print(f"Tick #{self.sequence} @ {datetime.fromtimestamp(tick).strftime('%H:%M:%S')}")
+                self.sequence += 1
+                tick += self.period
+
+    def report(self):
+        for symbol in self.symbols:
+            print(f"{symbol}: {self.sampled[symbol]} samples, "
+                  f"{self.missed[symbol]} missed ticks, {self.failed[symbol]} failed")
+
+
+def print_depth_alerts(depth_tracker, order_book):
+    _diff, alerts = depth_tracker.update(order_book)
+    for alert in alerts:
+        print(f"ALERT {alert}")
 
 
 def init_script():
@@ -18,22 +155,15 @@ def init_script():
 if __name__ == '__main__':
     base_coin, exchange = init_script()
 
-    sampled_coin = input("Coin to sample: ")
-    symbol = exchange.make_symbol(sampled_coin)
-    symbol_dir = f"{symbol.replace('/', '_')}_{exchange.name}"
-    os.makedirs(symbol_dir, exist_ok=True)
-    seq = 0
+    sampled_coins = input("Coins to sample (comma separated): ")
+    period = float(input("Sampling period in seconds [2]: ") or 2)
+    watchlist = [exchange.make_symbol(it.strip()) for it in sampled_coins.split(',') if it.strip()]
+    alert_factor = float(input("Alert when depth up to factor (1.25, 1.5, 2, 3, 5 or 10) collapses [2]: ") or 2)
+    depth_tracker = DepthTracker(alert_factor=alert_factor)
+    scheduler = SnapshotScheduler(exchange, watchlist, period=period,
+                                  on_snapshot=lambda _symbol, _tick, book: print_depth_alerts(depth_tracker, book))
     try:
-        while True:
-            order_book = OrderBook(symbol, exchange.connect())
-            order_book_df = order_book.to_df('asks')
-            order_book_df['sequence'] = seq
-            order_book_df.to_csv(
-                os.path.join(symbol_dir,
-                             f"ob_{seq:0>3}_{symbol_dir}-{datetime.now().strftime('%Y-%m-%d')}.csv"),
-                index=False)
-            print(f"Fetched sample #{seq}")
-            seq += 1
-            time.sleep(2)
+        scheduler.run()
     except KeyboardInterrupt as ki:
-        print(f"Done fetching {seq} samples")
+        print(f"Done fetching {scheduler.sequence} ticks")
+        scheduler.report()
@@ -0,0 +1,148 @@
+import pandas as pd
+import pytz
+from sqlalchemy import text
+
+from exchange_tools import OrderBook
+
+SCHEMA = 'ranked_orders'
+COLLECTION_TZ = pytz.timezone('Europe/Zurich')
+
+_CREATE_ORDERS = f"""
+create table if not exists {SCHEMA}.orders
+(
+    "timestamp"      text,
+    symbol           text,
+    side             text,
+    price            double precision,
+    factor           double precision,
+    volume           double precision,
+    base_volume      double precision,
+    csum_base_volume double precision,
+    volume_ranking   double precision,
+    collected_at     timestamptz,
+    collection_day   date
+);
+"""
+
+_ADD_TYPED_COLUMNS = f"""
+alter table {SCHEMA}.orders
+    add column if not exists collected_at timestamptz,
+    add column if not exists collection_day date;
+"""
+
+# The collection day is the local (Zurich) date, the same date the textual
+# timestamp column carries, so old and new rows land on the same day.
+_BACKFILL_TYPED_COLUMNS = f"""
+update {SCHEMA}.orders
+set collected_at   = "timestamp"::timestamptz,
+    collection_day = date("timestamp")
+where collection_day is null;
+"""
+
+_CREATE_ORDERS_INDEX = f"""
+create index if not exists orders_day_factor_idx
+    on {SCHEMA}.orders (collection_day, factor, csum_base_volume);
+"""
+
+_CREATE_DAILY_SYMBOLS = f"""
+create table if not exists {SCHEMA}.daily_symbols
+(
+    collection_day       date             not null,
+    symbol               text             not null,
+    samples              integer          not null,
+    max_volume_ranking   double precision,
+    max_factor           double precision,
+    max_csum_base_volume double precision,
+    last_collected_at    timestamptz,
+    primary key (collection_day, symbol)
+);
+"""
+
+_BACKFILL_DAILY_SYMBOLS = f"""
+insert into {SCHEMA}.daily_symbols
+select collection_day, symbol, count(distinct "timestamp"), max(volume_ranking), max(factor),
+       max(csum_base_volume), max(collected_at)
+from {SCHEMA}.orders
+group by collection_day, symbol
+on conflict do nothing;
+"""
+
+_UPSERT_DAILY_SYMBOL = f"""
+insert into {SCHEMA}.daily_symbols
+values (:collection_day, :symbol, :samples, :max_volume_ranking, :max_factor,
+        :max_csum_base_volume, :last_collected_at)
+on conflict (collection_day, symbol) do update
+    set samples              = daily_symbols.samples + excluded.samples,
+        max_volume_ranking   = greatest(daily_symbols.max_volume_ranking, excluded.max_volume_ranking),
+        max_factor           = greatest(daily_symbols.max_factor, excluded.max_factor),
+        max_csum_base_volume = greatest(daily_symbols.max_csum_base_volume, excluded.max_csum_base_volume),
+        last_collected_at    = greatest(daily_symbols.last_collected_at, excluded.last_collected_at);
+"""
+
+COLLECTION_DAYS_QUERY = f"""
+select collection_day as "collection day"
+from {SCHEMA}.daily_symbols
+group by collection_day
+order by collection_day desc;
+"""
+
+MARKETS_OF_INTEREST_QUERY = f"""
+select symbol                as "Symbol",
+       max(csum_base_volume) as "Cumulated Base Volume",
+       max(volume_ranking)   as "Volume Ranking",
+       max(factor)           as "Factor",
+       max(price)            as "Price"
+from {SCHEMA}.orders
+where collection_day = :collection_day
+  and factor between :min_factor and :max_factor
+  and csum_base_volume between :min_volume and :max_volume
+group by symbol;
+"""
+
+
+def prepare_storage(engine):
+    """Creates the orders table (or its typed columns), indexes and the daily summary table.
+    Rows collected before the migration are back-filled once."""
+    with engine.begin() as db:
+        db.execute(text(f"create schema if not exists {SCHEMA};"))
+        has_orders = db.execute(text(
+            "select 1 from information_schema.tables where table_schema = :schema and table_name = 'orders'"),
+            {'schema': SCHEMA}).first() is not None
+        db.execute(text(_CREATE_DAILY_SYMBOLS))
+        needs_backfill = has_orders and db.execute(text(
+            "select 1 from information_schema.columns "
+            "where table_schema = :schema and table_name = 'orders' and column_name = 'collection_day'"),
+            {'schema': SCHEMA}).first() is None
+        if has_orders:
+            db.execute(text(_ADD_TYPED_COLUMNS))
+        else:
+            db.execute(text(_CREATE_ORDERS))
+        if needs_backfill:
+            db.execute(text(_BACKFILL_TYPED_COLUMNS))
+            db.execute(text(_BACKFILL_DAILY_SYMBOLS))
+        db.execute(text(_CREATE_ORDERS_INDEX))
+
+
+def store_ranked_orders(engine, ranked_df, collected_at=None):
+    """Appends ranked orders and folds them into the per-day, per-symbol summary.
+    Rows are collected at the fetch time of their book (the `timestamp` column), so
+    they land on the same day as the back-filled ones. A summary sample is one scan
+    of a symbol, i.e. one distinct fetch time, whatever the number of ranked rows."""
+    if ranked_df.empty:
+        return
+    if collected_at is None:
+        collected_at = pd.to_datetime(ranked_df['timestamp'].map(OrderBook.parse_fetch_time), utc=True)
+    else:
+        collected_at = pd.Series(collected_at, index=ranked_df.index)
+    collected_at = collected_at.dt.tz_convert(COLLECTION_TZ)
+    ranked_df = ranked_df.assign(collected_at=collected_at, collection_day=collected_at.dt.date)
+    summary = ranked_df.groupby(['collection_day', 'symbol']).agg(
+        samples=('timestamp', 'nunique'),
+        max_volume_ranking=('volume_ranking', 'max'),
+        max_factor=('factor', 'max'),
+        max_csum_base_volume=('csum_base_volume', 'max'),
+        last_collected_at=('collected_at', 'max')).reset_index()
+
+    with engine.begin() as db:
+        ranked_df.to_sql('orders', db, schema=SCHEMA, index=False, if_exists='append')
+        db.execute(text(_UPSERT_DAILY_SYMBOL), summary.to_dict('records'))
@@ -1,5 +1,3 @@
-import os
-
 import numpy as np
 import pandas as pd
 import plotly.express as px
@@ -8,7 +6,8 @@ import streamlit as st
 from dotenv import load_dotenv
 from plotly.subplots import make_subplots
 
-from exchange_tools import ExchangeConnector, OrderBook
+from exchange_tools import ExchangeConnector
+from market_data import MarketDataService
 
 
 @st.cache_data
@@ -26,7 +25,7 @@ def compute_pump(_exchange, coin, time, pre, post):
     pump_data = _exchange.fetch_candlesticks(coin, time, pre, post)
 
     if pump_data is not None:
-        current = kucoin.fetch_ticker(symbol=f'{coin}-{os.getenv("BASE_CURRENCY") or st.secrets.BASE_CURRENCY}')
+        current = market_data.ticker(exchange.make_symbol(coin))
         pump_agg = pump_data.agg({
             "open": ['min', 'max', 'median'],
             "close": ['min', 'max', 'median'],
@@ -48,8 +47,8 @@ def compute_pump(_exchange, coin, time, pre, post):
 load_dotenv()
 
 st.title("Historical Pump and Dump event analysis")
-exchange = ExchangeConnector('kucoin', os.getenv('BASE_CURRENCY'))
-kucoin = exchange.connect()
+market_data = MarketDataService.dashboard(st.secrets)
+exchange = market_data.connector
 db =  st.connection("postgresql", type="sql")
 pumps_df = load_historical_data(db, exchange)
 
@@ -65,7 +64,7 @@ post_minutes = st.sidebar.slider("Minutes after pump: ", min_value=0, max_value=
 st.sidebar.markdown("---")
 hist_days = st.sidebar.slider("Days before pump:", min_value=1, max_value=365, value=60)
 st.sidebar.markdown("---")
-st.session_state.base_coin = os.getenv("BASE_CURRENCY") or st.secrets.BASE_CURRENCY
+st.session_state.base_coin = exchange.base_currency
 pumped_amount = int(st.sidebar.text_input(f"Pumped amount ({st.session_state.base_coin}):", value=500))
 
 pump_data = exchange.fetch_candlesticks(current_coin, pump_time, pre_minutes, post_minutes)
@@ -137,7 +136,7 @@ show_book = st.sidebar.checkbox(label="Display current Order book", value=False)
 
 if show_book:
     max_factor = st.sidebar.slider(label="Max pump factor", value=5, min_value=2, max_value=100)
-    book = OrderBook(f"{current_coin}-{st.session_state.base_coin}", kucoin)
+    book = market_data.order_book(f"{current_coin}-{st.session_state.base_coin}")
     ask_df = book.to_df('asks')
     fig = px.line(data_frame=ask_df[ask_df.factor <= max_factor], x='factor', y='csum_base_volume',
                   title='Cumulated volume by factor', log_y=True, log_x=False)
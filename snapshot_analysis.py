@@ -0,0 +1,118 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+
+import pandas as pd
+
+from exchange_tools import OrderBook
+from market_ranking import MarketRanking
+
+SNAPSHOT_FILE = re.compile(r'ob_(?P<sequence>\d+)_(?P<symbol_dir>.+)-(?P<day>\d{4}-\d{2}-\d{2})\.csv$')
+
+
+def list_snapshots(root='.', first_day=None, last_day=None):
+    """Snapshot files written by order_book_sampler under root, per symbol directory
+    and in sampling order, optionally restricted to a range of days (YYYY-MM-DD)"""
+    snapshots = dict()
+    for path in glob(os.path.join(root, '*', 'ob_*.csv')):
+        match = SNAPSHOT_FILE.search(os.path.basename(path))
+        if match is None:
+            continue
+        if (first_day and match['day'] < first_day) or (last_day and match['day'] > last_day):
+            continue
+        snapshots.setdefault(match['symbol_dir'], list()).append((match['day'], int(match['sequence']), path))
+    return {symbol_dir: [it[2] for it in sorted(files)] for symbol_dir, files in snapshots.items()}
+
+
+def shard_snapshots(snapshots, shard_size=250):
+    """Splits every symbol history into consecutive time ranges of at most shard_size snapshots"""
+    return [files[start:start + shard_size]
+            for files in snapshots.values()
+            for start in range(0, len(files), shard_size)]
+
+
+def snapshot_time(snapshot):
+    """Epoch milliseconds of the snapshot's fetch time, written by OrderBook.fetch_time
+    as Zurich local time with its abbreviation (CET/CEST), else of its sampler tick"""
+    stamp = snapshot['timestamp'].iloc[0]
+    try:
+        fetch_time = OrderBook.parse_fetch_time(stamp)
+    except ValueError:
+        fetch_time = pd.Timestamp(snapshot['tick'].iloc[0])
+    return int(fetch_time.timestamp() * 1000)
+
+
+def load_snapshot(path):
+    """Rebuilds the ask side of a sampled order book from its csv"""
+    snapshot = pd.read_csv(path)
+    if snapshot.empty:
+        return None, snapshot
+    book = OrderBook(snapshot['symbol'].iloc[0], None)
+    book.load_data({'bids': [], 'asks': snapshot[['price', 'volume']].to_numpy(),
+                    'timestamp': snapshot_time(snapshot)},
+                   last_price=snapshot['price'].iloc[0] / snapshot['factor'].iloc[0])
+    return book, snapshot
+
+
+def analyse_shard(paths, pump_volume, factors=(2, 3, 5)):
+    """Depth metrics of every snapshot of the shard, one row per snapshot,
+    with its fetch time in epoch milliseconds"""
+    books = list()
+    rows = list()
+    for path in paths:
+        book, snapshot = load_snapshot(path)
+        if book is None:
+            continue
+        books.append(book)
+        rows.append({
+            'symbol': book.symbol,
+            'sequence': snapshot['sequence'].iloc[0],
+            'fetch_time': book.timestamp,
+            'tick': snapshot['tick'].iloc[0] if 'tick' in snapshot else snapshot['timestamp'].iloc[0],
+            'last_price': book.last_price,
+            'levels': len(book.asks)})
+    result = pd.DataFrame(rows)
+    if not books:
+        return result
+
+    ranking = MarketRanking(books, 'asks')
+    peaks = ranking.peak_levels()
+    result['pump_volume_factor'] = ranking.pump_volume_factors(pump_volume)
+    for _factor in factors:
+        result[f'depth_{_factor}x'] = ranking.depth_up_to(_factor)
+    result['peak_factor'] = ranking.factors[peaks]
+    result['peak_base_volume'] = ranking.base_volumes[peaks]
+    result['peak_volume_ranking'] = ranking.volume_rankings[peaks]
+    return result
+
+
+def analyse_history(root='.', pump_volume=150000, factors=(2, 3, 5), first_day=None, last_day=None,
+                    shard_size=250, max_workers=None):
+    """Analyses the snapshot history on a process pool, yielding each shard's
+    metrics as soon as it is done"""
+    shards = shard_snapshots(list_snapshots(root, first_day, last_day), shard_size)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(analyse_shard, shard, pump_volume, factors) for shard in shards]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+if __name__ == '__main__':
+    snapshot_root = input("Snapshot directory [.]: ") or '.'
+    pump_volume = float(input("Pump volume [150000]: ") or 150000)
+    first_day = input("First day (YYYY-MM-DD) [all]: ") or None
+    last_day = input("Last day (YYYY-MM-DD) [all]: ") or None
+
+    metrics = list()
+    for shard_metrics in analyse_history(snapshot_root, pump_volume, first_day=first_day, last_day=last_day):
+        if not shard_metrics.empty:
+            print(f"Analysed {len(shard_metrics)} snapshots of {shard_metrics['symbol'].iloc[0]}")
+        metrics.append(shard_metrics)
+
+    if metrics:
+        metrics_df = pd.concat(metrics, ignore_index=True).sort_values(by=['symbol', 'fetch_time'])
+        metrics_df.to_csv('snapshot_metrics.csv', index=False)
+        print(f"Wrote metrics of {len(metrics_df)} snapshots to snapshot_metrics.csv")
+    else:
+        print("No snapshots found")